@@ -1,36 +1,71 @@
+import hashlib
 import os
-from datetime import datetime, timedelta
-from typing import Optional
+import time
+from datetime import timedelta
+from typing import Optional, Tuple
 
-from fastapi import Depends, HTTPException, status
-from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
-from jose import JWTError, jwt
-from passlib.context import CryptContext
-from pydantic import BaseModel
+import jwt
+from anyio import CapacityLimiter, to_thread
+from argon2 import PasswordHasher
+from argon2.exceptions import InvalidHashError, VerificationError
+from cachetools import TTLCache
+from fastapi import Depends, HTTPException, Request, status
+from pydantic import BaseModel, ConfigDict
 
 
 # JWT Configuration
 SECRET_KEY = os.getenv("JWT_SECRET", "your-secret-key-change-this-in-production")  # Fallback for local dev
 ALGORITHM = "HS256"
+_DECODE_ALGS = [ALGORITHM]
+_DECODE_OPTIONS = {"require": ["exp", "sub"]}
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
+ACCESS_TOKEN_EXPIRE = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+DEFAULT_EXPIRE = timedelta(minutes=15)
+
+# OpenAPI security scheme for bearer tokens; added to the schema in main.py, not a runtime dependency
+BEARER_SCHEME_NAME = "HTTPBearer"
+BEARER_SCHEME = {"type": "http", "scheme": "bearer"}
+
+CREDENTIALS_DETAIL = "Could not validate credentials"
+_WWW_AUTHENTICATE = {"WWW-Authenticate": "Bearer"}
+
+# Argon2 cost parameters, pinned so hashes are identical on every host. These are
+# baseline values, not calibrated: run scripts/tune_argon2.py on the deployment
+# hardware and commit its output to hit the ~300-500 ms per hash target.
+ARGON2_TIME_COST = 3
+ARGON2_MEMORY_COST = 65536  # KiB
+ARGON2_PARALLELISM = 4
 
 # Password hashing - using argon2 instead of bcrypt for better compatibility
-pwd_context = CryptContext(schemes=["argon2"], deprecated="auto")
+_ph = PasswordHasher(
+    time_cost=ARGON2_TIME_COST,
+    memory_cost=ARGON2_MEMORY_COST,
+    parallelism=ARGON2_PARALLELISM,
+)
 
-# HTTP Bearer token scheme
-security = HTTPBearer()
+# Concurrent hashes allowed in worker threads; each hash already uses ARGON2_PARALLELISM lanes
+ARGON2_MAX_CONCURRENT = max(1, (os.cpu_count() or 4) // ARGON2_PARALLELISM)
+_hash_limiter: Optional[CapacityLimiter] = None
+
+
+def _get_hash_limiter() -> CapacityLimiter:
+    """Dedicated limiter for password hashing, created lazily inside the event loop."""
+    global _hash_limiter
+    if _hash_limiter is None:
+        _hash_limiter = CapacityLimiter(ARGON2_MAX_CONCURRENT)
+    return _hash_limiter
 
 
 class Token(BaseModel):
+    model_config = ConfigDict(frozen=True, extra="ignore")
+
     access_token: str
     token_type: str
 
 
-class TokenData(BaseModel):
-    user_id: Optional[str] = None
-
-
 class User(BaseModel):
+    model_config = ConfigDict(frozen=True, extra="ignore")
+
     user_id: str
     username: str
     disabled: Optional[bool] = False
@@ -40,87 +75,115 @@ class UserInDB(User):
     hashed_password: str
 
 
+# Verified tokens: blake2b(token, 16 bytes) -> (payload, user). Entries are never served past the token's exp
+_jwt_cache: TTLCache[bytes, Tuple[dict, User]] = TTLCache(maxsize=10000, ttl=30)
+
+
 
 
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     """Verify plain password against hashed password."""
-    return pwd_context.verify(plain_password, hashed_password)
+    try:
+        return _ph.verify(hashed_password, plain_password)
+    except (VerificationError, InvalidHashError):
+        return False
 
 
 def get_password_hash(password: str) -> str:
     """Hash a password."""
-    return pwd_context.hash(password)
+    return _ph.hash(password)
 
 
 # Simple in-memory user storage
 _users_cache = {}
 
-# Initial users (passwords will be hashed on first access)
+# Initial users, hashed once at import time below
 _initial_users = {
     "testuser": {"user_id": "u1", "username": "testuser", "password": "secret", "disabled": False},
     "admin": {"user_id": "u2", "username": "admin", "password": "admin123", "disabled": False}
 }
 
+for _udata in _initial_users.values():
+    _users_cache[_udata["username"]] = UserInDB(
+        user_id=_udata["user_id"],
+        username=_udata["username"],
+        hashed_password=get_password_hash(_udata["password"]),
+        disabled=_udata.get("disabled", False)
+    )
+del _initial_users, _udata
+
 
 def get_user(username: str) -> Optional[UserInDB]:
     """Get user from database."""
-    # Initialize users on first access
-    if not _users_cache and _initial_users:
-        for uname, udata in _initial_users.items():
-            _users_cache[uname] = UserInDB(
-                user_id=udata["user_id"],
-                username=udata["username"],
-                hashed_password=get_password_hash(udata["password"]),
-                disabled=udata.get("disabled", False)
-            )
-    
     return _users_cache.get(username)
 
-def authenticate_user(username: str, password: str) -> Optional[UserInDB]:
-    """Authenticate user with username and password."""
+
+async def authenticate_user(username: str, password: str) -> Optional[UserInDB]:
+    """Authenticate user with username and password.
+
+    Argon2 hashing runs in a worker thread so it does not block the event loop.
+    """
     user = get_user(username)
     if not user:
         return None
-    if not verify_password(password, user.hashed_password):
+    if not await to_thread.run_sync(
+        verify_password, password, user.hashed_password, limiter=_get_hash_limiter()
+    ):
         return None
+    if _ph.check_needs_rehash(user.hashed_password):
+        new_hash = await to_thread.run_sync(get_password_hash, password, limiter=_get_hash_limiter())
+        user = user.model_copy(update={"hashed_password": new_hash})
+        _users_cache[username] = user
     return user
 
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
     """Create JWT access token."""
     to_encode = data.copy()
-    if expires_delta:
-        expire = datetime.utcnow() + expires_delta
-    else:
-        expire = datetime.utcnow() + timedelta(minutes=15)
-    to_encode.update({"exp": expire})
+    to_encode["exp"] = int(time.time() + (expires_delta or DEFAULT_EXPIRE).total_seconds())
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
 
-async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)) -> User:
-    """Dependency to get current authenticated user from JWT token."""
-    credentials_exception = HTTPException(
+def _credentials_error() -> HTTPException:
+    """Build a fresh 401; a shared instance would accumulate tracebacks across raises."""
+    return HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
-        detail="Could not validate credentials",
-        headers={"WWW-Authenticate": "Bearer"},
+        detail=CREDENTIALS_DETAIL,
+        headers=_WWW_AUTHENTICATE,
     )
-    
-    token = credentials.credentials
+
+
+async def _extract_bearer(request: Request) -> str:
+    """Dependency to read the bearer token straight from the Authorization header."""
+    header = request.headers.get("authorization")
+    if not header:
+        raise _credentials_error()
+    scheme, _sep, token = header.partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        raise _credentials_error()
+    return token
+
+
+async def get_current_user(token: str = Depends(_extract_bearer)) -> User:
+    """Dependency to get current authenticated user from JWT token."""
+    key = hashlib.blake2b(token.encode(), digest_size=16).digest()
+    cached = _jwt_cache.get(key)
+    if cached is not None:
+        if cached[0]["exp"] > time.time():
+            return cached[1]
+        _jwt_cache.pop(key, None)
     
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        user_id: str = payload.get("sub")
-        if user_id is None:
-            raise credentials_exception
-        token_data = TokenData(user_id=user_id)
-    except JWTError:
-        raise credentials_exception
+        payload = jwt.decode(token, SECRET_KEY, algorithms=_DECODE_ALGS, options=_DECODE_OPTIONS)
+    except jwt.PyJWTError:
+        raise _credentials_error() from None
     
-    user = get_user(token_data.user_id)
+    user = get_user(payload["sub"])
     if user is None:
-        raise credentials_exception
+        raise _credentials_error()
+    _jwt_cache[key] = (payload, user)
     return user
 
 
@@ -1,30 +1,43 @@
 import asyncio
 import os
-from datetime import timedelta
+import random
 from typing import Dict, Optional
 
 import httpx
-from fastapi import Depends, FastAPI, HTTPException
+import orjson
+from cachetools import TTLCache
+from fastapi import Depends, FastAPI, HTTPException, Request, Response
+from fastapi.dependencies.models import Dependant
+from fastapi.openapi.utils import get_openapi
+from fastapi.responses import ORJSONResponse
+from fastapi.routing import APIRoute
 from fastapi.security import OAuth2PasswordRequestForm
-from pydantic import BaseModel
+from pydantic import BaseModel, ConfigDict
 
 from app.auth import (
-    ACCESS_TOKEN_EXPIRE_MINUTES,
+    ACCESS_TOKEN_EXPIRE,
+    BEARER_SCHEME,
+    BEARER_SCHEME_NAME,
     Token,
     User,
     authenticate_user,
     create_access_token,
     get_current_active_user,
+    get_current_user,
 )
 
 
 class OrderCreate(BaseModel):
+    model_config = ConfigDict(frozen=True, extra="ignore")
+
     user_id: str
     item: str
     amount: int
 
 
 class OrderStatus(BaseModel):
+    model_config = ConfigDict(frozen=True, extra="ignore")
+
     id: str
     status: str
     item: str
@@ -35,37 +48,57 @@ class OrderStatus(BaseModel):
 
 ORDER_SERVICE_URL = os.getenv("ORDER_SERVICE_URL", "http://localhost:8002")
 
-app = FastAPI(title="API Gateway", version="0.1.0")
+app = FastAPI(title="API Gateway", version="0.1.0", default_response_class=ORJSONResponse)
+
+# Order statuses that never change once reached; only these are cached on read
+TERMINAL_STATUSES = frozenset({"succeeded", "failed"})
+
+_local_cache: TTLCache[str, OrderStatus] = TTLCache(maxsize=50_000, ttl=60)
 
-_local_cache: Dict[str, OrderStatus] = {}
+# In-flight upstream lookups, so concurrent GETs for one order share a single request
+_inflight: Dict[str, "asyncio.Task[Optional[OrderStatus]]"] = {}
+
+_http_client: httpx.AsyncClient | None = None
+
+# A read error may come after the upstream acted on the request, so it is only retried
+# for idempotent methods; connect errors happen before sending and are retried for any method
+_IDEMPOTENT_METHODS = frozenset({"GET", "HEAD", "OPTIONS", "PUT", "DELETE"})
+
+RETRY_BACKOFF_BASE = 0.1
+RETRY_BACKOFF_CAP = 2.0
 
 
 async def _make_request_with_retry(method: str, url: str, max_retries: int = 3, **kwargs) -> httpx.Response:
-    """Make HTTP request with retry logic."""
+    """Make HTTP request with retry logic (capped exponential backoff with jitter).
+
+    `method` must be an uppercase HTTP verb.
+    """
+    if not _http_client:
+        raise HTTPException(status_code=503, detail="HTTP client is not initialized")
     for attempt in range(max_retries):
         try:
-            async with httpx.AsyncClient(timeout=30.0) as client:
-                if method.upper() == "GET":
-                    resp = await client.get(url, **kwargs)
-                elif method.upper() == "POST":
-                    resp = await client.post(url, **kwargs)
-                else:
-                    raise ValueError(f"Unsupported method: {method}")
-                return resp
-        except (httpx.ConnectTimeout, httpx.ConnectError) as e:
-            if attempt < max_retries - 1:
-                await asyncio.sleep(1.0 * (attempt + 1))
+            return await _http_client.request(method, url, **kwargs)
+        except (httpx.ConnectTimeout, httpx.ConnectError, httpx.ReadError) as e:
+            retryable = method in _IDEMPOTENT_METHODS or not isinstance(e, httpx.ReadError)
+            if retryable and attempt < max_retries - 1:
+                delay = min(RETRY_BACKOFF_CAP, RETRY_BACKOFF_BASE * 2 ** attempt)
+                await asyncio.sleep(delay * (0.5 + random.random() * 0.5))
             else:
                 raise HTTPException(status_code=503, detail=f"Service unavailable: {str(e)}")
     raise HTTPException(status_code=503, detail="Service unavailable after retries")
 
 
 async def create_order_via_http(order: OrderCreate) -> OrderStatus:
-    resp = await _make_request_with_retry("POST", f"{ORDER_SERVICE_URL}/orders", json=order.model_dump())
+    body = orjson.dumps(order.model_dump())
+    resp = await _make_request_with_retry(
+        "POST",
+        f"{ORDER_SERVICE_URL}/orders",
+        content=body,
+        headers={"content-type": "application/json"},
+    )
     if resp.status_code != 200:
-        raise HTTPException(status_code=resp.status_code, detail=resp.text)
-    data = resp.json()
-    return OrderStatus(**data)
+        raise HTTPException(status_code=resp.status_code, detail=resp.content[:1024].decode("utf-8", "replace"))
+    return OrderStatus.model_construct(**resp.json())
 
 
 async def fetch_order_status(order_id: str) -> Optional[OrderStatus]:
@@ -73,8 +106,28 @@ async def fetch_order_status(order_id: str) -> Optional[OrderStatus]:
     if resp.status_code == 404:
         return None
     if resp.status_code != 200:
-        raise HTTPException(status_code=resp.status_code, detail=resp.text)
-    return OrderStatus(**resp.json())
+        raise HTTPException(status_code=resp.status_code, detail=resp.content[:1024].decode("utf-8", "replace"))
+    return OrderStatus.model_construct(**resp.json())
+
+
+async def fetch_order_status_coalesced(order_id: str) -> Optional[OrderStatus]:
+    """Fetch order status, joining an identical request that is already in flight.
+
+    The upstream call runs in its own task and callers await it through
+    asyncio.shield, so cancelling one caller does not cancel the others.
+    """
+    task = _inflight.get(order_id)
+    if task is None:
+        task = asyncio.ensure_future(fetch_order_status(order_id))
+        _inflight[order_id] = task
+
+        def _done(t: "asyncio.Task[Optional[OrderStatus]]") -> None:
+            _inflight.pop(order_id, None)
+            if not t.cancelled():
+                t.exception()  # mark as retrieved even if every caller went away
+
+        task.add_done_callback(_done)
+    return await asyncio.shield(task)
 
 
 # ============= AUTH ENDPOINTS =============
@@ -82,16 +135,15 @@ async def fetch_order_status(order_id: str) -> Optional[OrderStatus]:
 @app.post("/auth/login", response_model=Token)
 async def login(form_data: OAuth2PasswordRequestForm = Depends()):
     """Login endpoint - returns JWT token."""
-    user = authenticate_user(form_data.username, form_data.password)
+    user = await authenticate_user(form_data.username, form_data.password)
     if not user:
         raise HTTPException(
             status_code=401,
             detail="Incorrect username or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
-    access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = create_access_token(
-        data={"sub": user.username}, expires_delta=access_token_expires
+        data={"sub": user.username}, expires_delta=ACCESS_TOKEN_EXPIRE
     )
     return {"access_token": access_token, "token_type": "bearer"}
 
@@ -110,9 +162,7 @@ async def create_order(
     current_user: User = Depends(get_current_active_user)
 ) -> OrderStatus:
     """Create order - PROTECTED by JWT."""
-    created = await create_order_via_http(order)
-    _local_cache[created.id] = created
-    return created
+    return await create_order_via_http(order)
 
 
 @app.get("/orders/{order_id}", response_model=OrderStatus)
@@ -121,21 +171,66 @@ async def get_order(
     current_user: User = Depends(get_current_active_user)
 ) -> OrderStatus:
     """Get order - PROTECTED by JWT."""
-    if order_id in _local_cache:
-        return _local_cache[order_id]
-    status = await fetch_order_status(order_id)
+    cached = _local_cache.get(order_id)
+    if cached is not None:
+        return cached
+    status = await fetch_order_status_coalesced(order_id)
     if not status:
         raise HTTPException(status_code=404, detail="Order not found")
-    _local_cache[order_id] = status
+    if status.status in TERMINAL_STATUSES:
+        _local_cache[order_id] = status
     return status
 
 
 # ============= PUBLIC ENDPOINTS =============
 
-@app.get("/health")
-async def health():
-    """Health check - PUBLIC."""
-    return {"status": "ok", "order_service_url": ORDER_SERVICE_URL}
+_HEALTH_BODY = orjson.dumps({"status": "ok", "order_service_url": ORDER_SERVICE_URL})
+
+
+async def health(request: Request) -> Response:
+    """Health check - PUBLIC. Plain Starlette route, skips FastAPI dependency/response handling."""
+    return Response(_HEALTH_BODY, media_type="application/json")
+
+
+app.add_route("/health", health, methods=["GET"])
+
+
+# ============= OPENAPI =============
+
+def _requires_auth(dependant: Dependant) -> bool:
+    return any(d.call is get_current_user or _requires_auth(d) for d in dependant.dependencies)
+
+
+def custom_openapi() -> dict:
+    """OpenAPI schema with the bearer scheme on protected routes, without a runtime security dependency."""
+    if app.openapi_schema:
+        return app.openapi_schema
+    schema = get_openapi(title=app.title, version=app.version, routes=app.routes)
+    schema.setdefault("components", {}).setdefault("securitySchemes", {})[BEARER_SCHEME_NAME] = BEARER_SCHEME
+    for route in app.routes:
+        if isinstance(route, APIRoute) and _requires_auth(route.dependant):
+            for method in route.methods:
+                schema["paths"][route.path_format][method.lower()]["security"] = [{BEARER_SCHEME_NAME: []}]
+    app.openapi_schema = schema
+    return schema
+
+
+app.openapi = custom_openapi
+
+
+@app.on_event("startup")
+async def startup_event():
+    global _http_client
+    _http_client = httpx.AsyncClient(
+        timeout=30.0,
+        limits=httpx.Limits(max_connections=100, max_keepalive_connections=50),
+    )
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    if _http_client:
+        await _http_client.aclose()
 
 
 if __name__ == "__main__":
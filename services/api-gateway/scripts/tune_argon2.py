@@ -0,0 +1,55 @@
+"""Calibrate Argon2 cost parameters for the API gateway on the current host.
+
+Starts at the maximum memory cost and raises time_cost until a single hash
+takes at least the target wall time. Copy the result into app/auth.py.
+
+Usage: python scripts/tune_argon2.py [--target-ms 400] [--max-memory-kib 65536]
+"""
+import argparse
+import time
+
+from argon2 import PasswordHasher
+
+
+def measure(ph: PasswordHasher, rounds: int) -> float:
+    """Return the median wall time of one hash in milliseconds."""
+    samples = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        ph.hash("calibration-password")
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return samples[len(samples) // 2]
+
+
+def tune(target_ms: float, memory_cost: int, parallelism: int, max_time_cost: int, rounds: int):
+    time_cost = 1
+    while True:
+        ph = PasswordHasher(time_cost=time_cost, memory_cost=memory_cost, parallelism=parallelism)
+        elapsed = measure(ph, rounds)
+        print(f"time_cost={time_cost} memory_cost={memory_cost} parallelism={parallelism}: {elapsed:.1f} ms")
+        if elapsed >= target_ms or time_cost >= max_time_cost:
+            return time_cost, elapsed
+        time_cost += 1
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--target-ms", type=float, default=400.0)
+    parser.add_argument("--max-memory-kib", type=int, default=65536)
+    parser.add_argument("--parallelism", type=int, default=4)
+    parser.add_argument("--max-time-cost", type=int, default=20)
+    parser.add_argument("--rounds", type=int, default=5)
+    args = parser.parse_args()
+
+    time_cost, elapsed = tune(
+        args.target_ms, args.max_memory_kib, args.parallelism, args.max_time_cost, args.rounds
+    )
+    print()
+    print(f"ARGON2_TIME_COST = {time_cost}")
+    print(f"ARGON2_MEMORY_COST = {args.max_memory_kib}  # KiB")
+    print(f"ARGON2_PARALLELISM = {args.parallelism}  # ~{elapsed:.0f} ms per hash")
+
+
+if __name__ == "__main__":
+    main()